@@ -0,0 +1,76 @@
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        """No-op stand-in so the kernels still run (as plain Python) without numba."""
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+
+        def decorator(func):
+            return func
+        return decorator
+
+
+@njit(cache=True, fastmath=True)
+def sma_nb(close, length):
+    """Rolling SMA using a running sum: O(n) regardless of length."""
+    n = close.shape[0]
+    out = np.full(n, np.nan)
+    if n < length:
+        return out
+
+    s = 0.0
+    for i in range(length):
+        s += close[i]
+    out[length - 1] = s / length
+
+    for i in range(length, n):
+        s += close[i] - close[i - length]
+        out[i] = s / length
+    return out
+
+
+@njit(cache=True, fastmath=True)
+def ema_nb(close, length):
+    """
+    EMA with alpha = 2 / (length + 1).
+    Seeded with the SMA of the first `length` bars, same as TA-Lib.
+    """
+    n = close.shape[0]
+    out = np.full(n, np.nan)
+    if n < length:
+        return out
+
+    alpha = 2.0 / (length + 1)
+    ema = 0.0
+    for i in range(length):
+        ema += close[i]
+    ema /= length
+    out[length - 1] = ema
+
+    for i in range(length, n):
+        ema = alpha * close[i] + (1.0 - alpha) * ema
+        out[i] = ema
+    return out
+
+
+@njit(cache=True, fastmath=True)
+def macd_nb(close, fast=12, slow=26, signal=9):
+    """
+    MACD line, signal line and histogram, bar-for-bar equal to talib.MACD.
+    Like TA-Lib, the fast EMA is seeded at the slow lookback (SMA of the
+    `fast` bars ending at bar slow-1), not from the first bar.
+    """
+    n = close.shape[0]
+    macd = np.full(n, np.nan)
+    macd_signal = np.full(n, np.nan)
+    if n < slow:
+        return macd, macd_signal, macd - macd_signal
+
+    offset = slow - fast
+    macd[offset:] = ema_nb(close[offset:], fast) - ema_nb(close, slow)[offset:]
+    macd_signal[slow - 1:] = ema_nb(macd[slow - 1:], signal)
+    macd[:min(n, slow + signal - 2)] = np.nan
+    return macd, macd_signal, macd - macd_signal
@@ -1,23 +1,42 @@
-import ccxt
+import asyncio
 import pandas as pd
-import pandas_ta as ta
 import datetime
+import math
 import time
 import sys
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-import yfinance as yf
+
+from _indicators_numba import sma_nb, ema_nb, macd_nb
+
+try:
+    import talib  # C implementation, preferred when the TA-Lib library is installed
+except ImportError:
+    talib = None
 
 # --- Configuration ---
 SYMBOL = 'BTC/USDT'
-TIMEFRAMES = {
-    '1M': '1M',
-    '1w': '1w',
-    '1d': '1d',
-    '4h': '4h',
-    '1h': '1h'
-}
+TIMEFRAMES = (  # (display key, exchange timeframe), iterated in this order
+    ('1M', '1M'),
+    ('1w', '1w'),
+    ('1d', '1d'),
+    ('4h', '4h'),
+    ('1h', '1h'),
+)
+TIMEFRAME_KEYS = tuple(tf_key for tf_key, _ in TIMEFRAMES)
 LIMIT = 1000  # Fetch enough data for long-term MAs
+# float32 (~7 significant digits) is plenty for charting and the 0.5% signal threshold
+OHLCV_DTYPES = {'open': 'float32', 'high': 'float32', 'low': 'float32', 'close': 'float32', 'volume': 'float32'}
 EXCHANGE_ID = 'binance'
+SMA_LENGTHS = (7, 25, 100, 200)
+EMA_LENGTH = 20
+MACD_FAST, MACD_SLOW, MACD_SIGNAL = 12, 26, 9
+TREND_LABELS = ("下降トレンド", "レンジ / 中立", "上昇トレンド")  # Indexed by trend state + 1
+MA_COLUMNS = ['SMA7', 'SMA25', 'SMA100', 'SMA200', 'EMA20']
+MACD_COLUMNS = ['MACD', 'MACD_Signal', 'MACD_Hist']  # Stored as float32
+INDICATOR_COLUMNS = MA_COLUMNS + MACD_COLUMNS
+# Leading bars left NaN per column (same warm-up as TA-Lib)
+INDICATOR_LOOKBACKS = [length - 1 for length in SMA_LENGTHS] + [EMA_LENGTH - 1] + [MACD_SLOW + MACD_SIGNAL - 2] * len(MACD_COLUMNS)
 
 # --- Logic Constants ---
 CYCLE_START_YEAR = 2022  # Reference point for 4-year cycle (2022 was the 'down' year)
@@ -52,30 +71,99 @@ def get_anomaly_phase():
         
     return phase, bias
 
+def _ohlcv_to_df(ohlcv):
+    """Builds the OHLCV DataFrame from ccxt's list of [ts, o, h, l, c, v] rows."""
+    # One NumPy conversion, then per-column slices (no per-row dtype inference)
+    arr = np.asarray(ohlcv, dtype=np.float64)
+    columns = {'timestamp': pd.to_datetime(arr[:, 0].astype('int64'), unit='ms')}
+    for i, (col, dtype) in enumerate(OHLCV_DTYPES.items(), start=1):
+        columns[col] = arr[:, i].astype(dtype)
+    return pd.DataFrame(columns)
+
+def _unsupported_error(exchange):
+    """Error message when the exchange cannot serve OHLCV, else None."""
+    if not exchange.has.get('fetchOHLCV'):
+        return f"{exchange.id} does not support fetchOHLCV"
+    return None
+
 def fetch_data(exchange, symbol, timeframe, limit, retries=3):
     """Fetches OHLCV data from the exchange with retries. Returns (df, last_error)."""
+    error = _unsupported_error(exchange)
+    if error:
+        return None, error
+
     last_error = "Unknown error"
     for attempt in range(retries):
         try:
             ohlcv = exchange.fetch_ohlcv(symbol, timeframe, limit=limit)
-            if not ohlcv or len(ohlcv) == 0:
+            if not ohlcv:
                 last_error = "Exchange returned 0 bars"
                 time.sleep(1)
                 continue
-            df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-            df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-            return df, None
+            return _ohlcv_to_df(ohlcv), None
         except Exception as e:
             last_error = str(e)
             print(f"Error fetching data for {timeframe} (Attempt {attempt+1}/{retries}): {e}")
-            time.sleep(1 * (attempt + 1)) # Exponential backoff
+            time.sleep(1 * (attempt + 1)) # Linear backoff
     return None, last_error
 
+async def fetch_data_async(exchange, symbol, timeframe, limit, retries=3):
+    """fetch_data for a ccxt.async_support exchange. Returns (df, last_error)."""
+    error = _unsupported_error(exchange)
+    if error:
+        return None, error
+
+    last_error = "Unknown error"
+    for attempt in range(retries):
+        try:
+            ohlcv = await exchange.fetch_ohlcv(symbol, timeframe, limit=limit)
+            if not ohlcv:
+                last_error = "Exchange returned 0 bars"
+                await asyncio.sleep(1)
+                continue
+            return _ohlcv_to_df(ohlcv), None
+        except Exception as e:
+            last_error = str(e)
+            print(f"Error fetching data for {timeframe} (Attempt {attempt+1}/{retries}): {e}")
+            await asyncio.sleep(1 * (attempt + 1)) # Linear backoff
+    return None, last_error
+
+async def fetch_all(symbol, timeframes=TIMEFRAMES, limit=LIMIT, exchange_id=EXCHANGE_ID):
+    """
+    Fetches every timeframe concurrently over one async ccxt session.
+    Returns {tf_key: (df, last_error)} in the order of `timeframes`.
+    """
+    import ccxt.async_support as ccxt_async  # Lazy: only the CLI path needs the async exchanges
+
+    exchange = getattr(ccxt_async, exchange_id)({'enableRateLimit': True})
+    try:
+        results = await asyncio.gather(*[
+            fetch_data_async(exchange, symbol, tf_val, limit) for _, tf_val in timeframes
+        ])
+        return {tf_key: result for (tf_key, _), result in zip(timeframes, results)}
+    finally:
+        await exchange.close()
+
+def fetch_timeframes(fetch, timeframes=TIMEFRAMES):
+    """
+    Calls fetch(timeframe) for every timeframe in parallel.
+    Fetches are network-bound, so threads turn N round-trips into ~1.
+    ccxt's sync rate limiter is not thread-safe and does not pace these calls;
+    one request per timeframe stays well inside exchange limits. Load the
+    exchange's markets before calling, so the threads don't each load them.
+    Returns {tf_key: (df, last_error)} in the order of `timeframes`.
+    """
+    with ThreadPoolExecutor(max_workers=len(timeframes)) as executor:
+        futures = {tf_key: executor.submit(fetch, tf_val) for tf_key, tf_val in timeframes}
+    return {tf_key: future.result() for tf_key, future in futures.items()}
+
 def fetch_data_yfinance(symbol, timeframe, limit=1000):
     """
     Fetches OHLCV data from Yahoo Finance.
     More reliable for cloud hosting as it lacks geo-blocks.
     """
+    import yfinance as yf  # Lazy: slow to import and only needed for this source
+
     # Mapping timeframe to yfinance intervals
     tf_map = {
         '1M': '1mo',
@@ -130,60 +218,241 @@ def fetch_data_yfinance(symbol, timeframe, limit=1000):
             }).dropna()
             df = resampled.reset_index()
 
+        df = df.astype(OHLCV_DTYPES)
         return df, None
     except Exception as e:
         return None, str(e)
 
+def _sma(close, length):
+    """SMA from the active backend (TA-Lib or the numba kernels)."""
+    if talib is not None:
+        return talib.SMA(close, timeperiod=length)
+    return sma_nb(close, length)
+
+def _ema(close, length):
+    """EMA from the active backend (TA-Lib or the numba kernels)."""
+    if talib is not None:
+        return talib.EMA(close, timeperiod=length)
+    return ema_nb(close, length)
+
+def _macd(close):
+    """MACD (12, 26, 9) as three raw arrays: line, signal, histogram."""
+    if talib is not None:
+        return talib.MACD(close, fastperiod=MACD_FAST, slowperiod=MACD_SLOW, signalperiod=MACD_SIGNAL)
+    return macd_nb(close, MACD_FAST, MACD_SLOW, MACD_SIGNAL)
+
 def calculate_indicators(df):
-    """Calculates SMA, EMA, MACD."""
-    if df is None or len(df) < 200:
+    """Calculates SMA, EMA, MACD. Frames that already have them are returned as-is."""
+    if df is None or 'SMA200' in df.columns or len(df) < 200:
         return df
 
-    # SMA
-    df['SMA7'] = ta.sma(df['close'], length=7)
-    df['SMA25'] = ta.sma(df['close'], length=25)
-    df['SMA100'] = ta.sma(df['close'], length=100)
-    df['SMA200'] = ta.sma(df['close'], length=200)
+    close = df['close'].to_numpy(dtype=np.float64)
 
-    # EMA
-    df['EMA20'] = ta.ema(df['close'], length=20)
+    # SMA 7/25/100/200, then EMA20 (same order as MA_COLUMNS)
+    averages = [(_sma, length) for length in SMA_LENGTHS] + [(_ema, EMA_LENGTH)]
+    for col, (average, length) in zip(MA_COLUMNS, averages):
+        df[col] = average(close, length)
 
     # MACD (12, 26, 9)
-    macd = ta.macd(df['close'], fast=12, slow=26, signal=9)
-    df = pd.concat([df, macd], axis=1)
-    # Rename columns for clarity (pandas_ta default names can be verbose)
-    df.rename(columns={'MACD_12_26_9': 'MACD', 'MACDs_12_26_9': 'MACD_Signal', 'MACDh_12_26_9': 'MACD_Hist'}, inplace=True)
+    for col, values in zip(MACD_COLUMNS, _macd(close)):
+        df[col] = values.astype(np.float32)
+
+    return df
+
+def _seed_indicator_state(df, state):
+    """Stores running SMA sums and EMA values as of the last closed bar (row -2)."""
+    n = len(df)
+    j = n - 2
+    state.clear()
+    if j < max(SMA_LENGTHS) - 1:
+        return
+
+    close = df['close'].to_numpy(dtype=np.float64)
+    state['df'] = df
+    state['last_ts'] = df['timestamp'].iloc[j]
+    state['sma_sum'] = {length: float(close[j - length + 1:j + 1].sum()) for length in SMA_LENGTHS}
+    state['ema20'] = float(df['EMA20'].iloc[j])
+    # The MACD fast EMA is seeded at the slow lookback, as in talib.MACD
+    state['ema12'] = float(_ema(close[MACD_SLOW - MACD_FAST:j + 1], MACD_FAST)[-1])
+    state['ema26'] = float(_ema(close[:j + 1], MACD_SLOW)[-1])
+    # Recomputed in float64: the stored MACD columns are float32
+    state['macd_signal_ema'] = float(_macd(close[:j + 1])[1][-1])
+
+def update_indicators(df, state):
+    """
+    Incremental calculate_indicators.
+    `state` is a dict kept by the caller between calls for one symbol/timeframe.
+    Bars up to the last closed bar of the previous call are copied over, and only
+    the k newer bars go through the SMA running sums and EMA recurrences: O(k).
+    Falls back to a full calculation when the frames do not overlap.
+
+    SMAs and the NaN warm-up match calculate_indicators exactly. EMA/MACD values
+    keep the history of earlier frames, so once the window has slid they differ
+    from a fresh calculation by an amount that decays geometrically with age
+    (negligible well before the latest bars).
+    """
+    if df is None or len(df) < 200:
+        return df
+
+    prev = state.get('df')
+    if prev is None:
+        df = calculate_indicators(df)
+        _seed_indicator_state(df, state)
+        return df
+
+    # Nothing changed since the last call (e.g. Streamlit rerun on a cache hit)
+    n = len(df)
+    if (n == len(prev) and df['timestamp'].iloc[-1] == prev['timestamp'].iloc[-1]
+            and df['close'].iloc[-1] == prev['close'].iloc[-1]):
+        # Keep the fresh OHLCV (the live candle's high/low/volume may still move)
+        df[MA_COLUMNS] = prev[MA_COLUMNS].to_numpy()
+        df[MACD_COLUMNS] = prev[MACD_COLUMNS].to_numpy()
+        state['df'] = df
+        return df
+
+    # Locate the previous anchor bar in the new frame
+    p = int(df['timestamp'].searchsorted(state['last_ts']))
+    q = len(prev) - 2
+    if p >= n or df['timestamp'].iloc[p] != state['last_ts'] or p > q or p < max(SMA_LENGTHS) - 1:
+        df = calculate_indicators(df)
+        _seed_indicator_state(df, state)
+        return df
+
+    close = df['close'].to_numpy(dtype=np.float64)
+    block = np.empty((n, len(INDICATOR_COLUMNS)))
+    block[:p + 1] = prev[INDICATOR_COLUMNS].to_numpy(dtype=np.float64)[q - p:q + 1]
 
+    a20, a12, a26, a9 = (2.0 / (length + 1) for length in (EMA_LENGTH, MACD_FAST, MACD_SLOW, MACD_SIGNAL))
+    sma_sum = dict(state['sma_sum'])
+    ema20, ema12, ema26 = state['ema20'], state['ema12'], state['ema26']
+    signal = state['macd_signal_ema']
+    for i in range(p + 1, n):
+        c = close[i]
+        for length in SMA_LENGTHS:
+            sma_sum[length] += c - close[i - length]
+        ema20 = a20 * c + (1 - a20) * ema20
+        ema12 = a12 * c + (1 - a12) * ema12
+        ema26 = a26 * c + (1 - a26) * ema26
+        macd = ema12 - ema26
+        signal = a9 * macd + (1 - a9) * signal
+        block[i] = [sma_sum[length] / length for length in SMA_LENGTHS] + [ema20, macd, signal, macd - signal]
+
+        # Bar n-2 is closed: it becomes the anchor for the next call
+        if i == n - 2:
+            state['last_ts'] = df['timestamp'].iloc[i]
+            state['sma_sum'] = dict(sma_sum)
+            state['ema20'], state['ema12'], state['ema26'] = ema20, ema12, ema26
+            state['macd_signal_ema'] = signal
+
+    # Rows copied from an earlier window may be warm-up rows in this one
+    for col, lookback in enumerate(INDICATOR_LOOKBACKS):
+        block[:lookback, col] = np.nan
+
+    df[MA_COLUMNS] = block[:, :len(MA_COLUMNS)]
+    df[MACD_COLUMNS] = block[:, len(MA_COLUMNS):].astype(np.float32)
+    state['df'] = df
     return df
 
+def _batch_sma(closes, length):
+    """Rolling SMA along the last axis of a 2D array (cumsum trick)."""
+    out = np.full(closes.shape, np.nan)
+    csum = np.cumsum(closes, axis=-1)
+    out[:, length - 1] = csum[:, length - 1] / length
+    out[:, length:] = (csum[:, length:] - csum[:, :-length]) / length
+    return out
+
+def _batch_ema(closes, length):
+    """
+    EMA along the last axis of a 2D array.
+    Seeded with the SMA of the first `length` bars, same as TA-Lib.
+    """
+    from scipy.signal import lfilter  # Lazy: scipy.signal is slow to import
+
+    alpha = 2.0 / (length + 1)
+    out = np.full(closes.shape, np.nan)
+    seed = closes[:, :length].mean(axis=-1)
+    out[:, length - 1] = seed
+    if closes.shape[-1] > length:
+        zi = ((1 - alpha) * seed)[:, None]
+        out[:, length:], _ = lfilter([alpha], [1.0, alpha - 1.0], closes[:, length:], axis=-1, zi=zi)
+    return out
+
+def calculate_indicators_batch(dfs):
+    """
+    Calculates SMA, EMA, MACD for several timeframes at once.
+    Frames of equal length are stacked into one (n_tf, n_bars) matrix so every
+    indicator is computed in a single vectorized pass. Frames are updated in place.
+    """
+    groups = {}
+    for key, df in dfs.items():
+        if df is not None and 'SMA200' not in df.columns and len(df) >= 200:
+            groups.setdefault(len(df), []).append(key)
+
+    for keys in groups.values():
+        closes = np.stack([dfs[k]['close'].to_numpy(dtype=np.float64) for k in keys])
+
+        # MACD: like talib.MACD, the fast EMA is seeded at the slow lookback
+        offset = MACD_SLOW - MACD_FAST
+        macd = np.full(closes.shape, np.nan)
+        macd[:, offset:] = _batch_ema(closes[:, offset:], MACD_FAST) - _batch_ema(closes, MACD_SLOW)[:, offset:]
+        macd_signal = np.full(closes.shape, np.nan)
+        macd_signal[:, MACD_SLOW - 1:] = _batch_ema(macd[:, MACD_SLOW - 1:], MACD_SIGNAL)
+        macd[:, :MACD_SLOW + MACD_SIGNAL - 2] = np.nan  # Same warm-up as talib.MACD
+
+        out = np.stack(
+            [_batch_sma(closes, length) for length in SMA_LENGTHS]
+            + [_batch_ema(closes, EMA_LENGTH), macd, macd_signal, macd - macd_signal],
+            axis=1,
+        )
+
+        for i, k in enumerate(keys):
+            dfs[k][MA_COLUMNS] = out[i, :len(MA_COLUMNS)].T
+            dfs[k][MACD_COLUMNS] = out[i, len(MA_COLUMNS):].T.astype(np.float32)
+
+    return dfs
+
+def tail_values(df, columns=('close', 'SMA200', 'MACD')):
+    """Last-bar values as plain floats (NaN for missing columns), read once per frame."""
+    return {c: float(df[c].values[-1]) if c in df.columns else math.nan for c in columns}
+
 def analyze_trend(df, timeframe):
     """
     Analyzes trend based on MAs.
     UP Trend: Price > 200SMA and Price > 100SMA
     DOWN Trend: Price < 200SMA and Price < 100SMA
     """
-    
-    if df is None or df.empty:
-        return "N/A"
-    
-    # Check if necessary columns exist
-    if 'SMA200' not in df.columns or 'SMA100' not in df.columns:
-        return "データ不足 (>200本必要)"
-        
-    last_row = df.iloc[-1]
-    close = last_row['close']
-    sma200 = last_row['SMA200']
-    sma100 = last_row['SMA100']
-    
-    if pd.isna(sma200):
-        return "データ不足"
+    return analyze_trends({timeframe: df})[timeframe]
 
-    if close > sma200 and close > sma100:
-        return "上昇トレンド"
-    elif close < sma200 and close < sma100:
-        return "下降トレンド"
-    else:
-        return "レンジ / 中立"
+def analyze_trends(dfs):
+    """
+    Batched analyze_trend: classifies every timeframe in one branchless NumPy pass.
+    Returns {tf_key: trend label}.
+    """
+    trends = dict.fromkeys(dfs)
+    keys = []
+    for tf_key, df in dfs.items():
+        if df is None or df.empty:
+            trends[tf_key] = "N/A"
+        # Check if necessary columns exist
+        elif 'SMA200' not in df.columns or 'SMA100' not in df.columns:
+            trends[tf_key] = "データ不足 (>200本必要)"
+        else:
+            keys.append(tf_key)
+
+    if not keys:
+        return trends
+
+    close = np.array([dfs[k]['close'].values[-1] for k in keys], dtype=np.float64)
+    sma200 = np.array([dfs[k]['SMA200'].values[-1] for k in keys], dtype=np.float64)
+    sma100 = np.array([dfs[k]['SMA100'].values[-1] for k in keys], dtype=np.float64)
+
+    up = (close > sma200) & (close > sma100)
+    down = (close < sma200) & (close < sma100)
+    state = up.astype(np.int8) - down.astype(np.int8)  # -1 / 0 / 1
+
+    for tf_key, s, missing in zip(keys, state, np.isnan(sma200)):
+        trends[tf_key] = "データ不足" if missing else TREND_LABELS[s + 1]
+    return trends
 
 def detect_signals(df, timeframe):
     """
@@ -198,34 +467,23 @@ def detect_signals(df, timeframe):
         return []
 
     signals = []
-    last_row = df.iloc[-1]
-    prev_row = df.iloc[-2]
-    
-    close = last_row['close']
+
+    if 'EMA20' not in df.columns or 'MACD' not in df.columns:
+        return signals
+
+    # Plain NumPy tail reads: no per-row Series is built
+    close, ema20, macd, signal, hist = (df[c].values[-1] for c in ('close', 'EMA20', 'MACD', 'MACD_Signal', 'MACD_Hist'))
+    prev_macd, prev_signal, prev_hist = (df[c].values[-2] for c in ('MACD', 'MACD_Signal', 'MACD_Hist'))
 
     # --- Return Move Check (Price near EMA20) ---
-    if 'EMA20' not in df.columns:
-         return signals
-    
-    ema20 = last_row['EMA20']
-    
-    # Define "Near" as within 0.5% distance
-    dist_to_ema20 = abs(close - ema20) / close
-    is_near_ema20 = dist_to_ema20 < 0.005 
+    # Define "Near" as within 0.5% distance (multiplied out: no division by close)
+    is_near_ema20 = abs(close - ema20) < 0.005 * close
 
     # --- MACD Logic ---
-    if 'MACD' not in df.columns:
-        return signals
-
-    macd = last_row['MACD']
-    signal = last_row['MACD_Signal']
-    hist = last_row['MACD_Hist']
-    prev_hist = prev_row['MACD_Hist']
-    
     # Golden Cross (GC): MACD crosses above Signal
-    is_gc = (prev_row['MACD'] <= prev_row['MACD_Signal']) and (last_row['MACD'] > last_row['MACD_Signal'])
+    is_gc = (prev_macd <= prev_signal) and (macd > signal)
     # Dead Cross (DC): MACD crosses below Signal
-    is_dc = (prev_row['MACD'] >= prev_row['MACD_Signal']) and (last_row['MACD'] < last_row['MACD_Signal'])
+    is_dc = (prev_macd >= prev_signal) and (macd < signal)
     
     # Histogram Reversal (Early signal)
     hist_improving = hist > prev_hist and hist < 0 # Improving in negative territory
@@ -259,35 +517,38 @@ def main():
     print(f"戦略的バイアス (大局): {bias}")
     print("---------------------------------------------")
 
-    # 2. Setup Exchange
-    exchange = getattr(ccxt, EXCHANGE_ID)()
-    
-    # 3. Iterate Timeframes and Analyze
-    trend_summary = {}
+    # 2. Fetch all Timeframes concurrently (one async exchange session)
+    print("全時間足のデータを取得中...")
+    results = asyncio.run(fetch_all(SYMBOL))
+
+    # 3. Analyze
     all_signals = []
     
     rows = []
 
-    for tf_key, tf_val in TIMEFRAMES.items():
-        print(f"{tf_key}のデータを取得中...")
-        df, error = fetch_data(exchange, SYMBOL, tf_val, LIMIT)
-        
+    dfs = {}
+    for tf_key, (df, error) in results.items():
         if df is not None:
-            df = calculate_indicators(df)
-            trend = analyze_trend(df, tf_key)
-            trend_summary[tf_key] = trend
-            
-            signals = detect_signals(df, tf_key)
-            all_signals.extend(signals)
-            
-            # Prepare data for summary table
-            last_price = df.iloc[-1]['close']
-            sma200 = df.iloc[-1]['SMA200'] if 'SMA200' in df.columns and not pd.isna(df.iloc[-1]['SMA200']) else 0
-            macd_val = df.iloc[-1]['MACD'] if 'MACD' in df.columns and not pd.isna(df.iloc[-1]['MACD']) else 0
-            rows.append([tf_key, last_price, trend, f"{sma200:.2f}", f"{macd_val:.2f}"])
+            dfs[tf_key] = df
         else:
             print(f"Error fetching {tf_key}: {error}")
-        time.sleep(0.5) # Avoid rate limits
+
+    calculate_indicators_batch(dfs)
+
+    trend_summary = analyze_trends(dfs)
+
+    for tf_key, df in dfs.items():
+        trend = trend_summary[tf_key]
+        
+        signals = detect_signals(df, tf_key)
+        all_signals.extend(signals)
+        
+        # Prepare data for summary table
+        tail = tail_values(df)
+        last_price = tail['close']
+        sma200 = tail['SMA200'] if not math.isnan(tail['SMA200']) else 0
+        macd_val = tail['MACD'] if not math.isnan(tail['MACD']) else 0
+        rows.append([tf_key, f"{last_price:.2f}", trend, f"{sma200:.2f}", f"{macd_val:.2f}"])
 
     # 4. Output Summary
     print("\n--- マルチタイムフレーム分析 ---")
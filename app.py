@@ -1,10 +1,12 @@
 import streamlit as st
 # v1.1 - Force cache refresh
+import math
+import threading
+from collections import OrderedDict
 import pandas as pd
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import ccxt
-import time
 import analysis_logic as logic
 
 # --- Configuration ---
@@ -55,18 +57,50 @@ st.sidebar.write("Developed based on Cycle & Trend Logic")
 
 # --- Main Functions ---
 
-@st.cache_data(ttl=300) # Cache data for 5 minutes
-def load_data(exch_id, sym, tf, limit):
-    # Add a small delay to respect rate limits
-    time.sleep(0.5) 
-    
+MAX_LINE_POINTS = 500 # Indicator traces are downsampled to about this many points
+MAX_INDICATOR_STATES = 50 # Least recently used (source, symbol, timeframe) states are dropped beyond this
+
+@st.cache_resource # One exchange (and HTTP session) per source, shared across reruns
+def get_exchange(exch_id):
+    exchange = getattr(ccxt, exch_id)()
+    # Load markets once here: otherwise every fetch thread sees empty markets and loads them itself
+    try:
+        exchange.load_markets()
+    except Exception as e:
+        print(f"Error loading markets for {exch_id}: {e}") # fetch_data retries and reports per timeframe
+    return exchange
+
+@st.cache_resource # Running indicator state per (source, symbol, timeframe), shared by all sessions
+def get_indicator_states():
+    return OrderedDict(), threading.Lock()
+
+def get_indicator_state(key):
+    """Returns the state dict for `key`, evicting the least recently used ones beyond MAX_INDICATOR_STATES."""
+    states, lock = get_indicator_states()
+    with lock:
+        state = states.pop(key, None)
+        if state is None:
+            state = {}
+        states[key] = state
+        while len(states) > MAX_INDICATOR_STATES:
+            states.popitem(last=False)
+    return state
+
+@st.cache_data(ttl=300) # Cache data (with indicators) for 5 minutes
+def load_data(exch_id, sym, tfs, limit):
+    """Fetches every timeframe in parallel and adds indicators. Returns {tf_key: (df, error)}."""
     if "Yahoo Finance" in exch_id:
-        df, error = logic.fetch_data_yfinance(sym, tf, limit)
+        results = logic.fetch_timeframes(lambda tf: logic.fetch_data_yfinance(sym, tf, limit), tfs)
     else:
-        exchange = getattr(ccxt, exch_id)()
-        df, error = logic.fetch_data(exchange, sym, tf, limit)
-    
-    return df, error
+        exchange = get_exchange(exch_id)
+        results = logic.fetch_timeframes(lambda tf: logic.fetch_data(exchange, sym, tf, limit), tfs)
+
+    # Indicators are cached with the data, so cache hits skip them entirely.
+    # On a refresh only bars newer than the previous fetch are recomputed.
+    return {
+        tf_key: (logic.update_indicators(df, get_indicator_state((exch_id, sym, tf_key))) if df is not None else None, error)
+        for tf_key, (df, error) in results.items()
+    }
 
 def plot_chart(df, timeframe):
     fig = make_subplots(rows=2, cols=1, shared_xaxes=True, 
@@ -78,17 +112,21 @@ def plot_chart(df, timeframe):
                 open=df['open'], high=df['high'],
                 low=df['low'], close=df['close'], name="Price"), row=1, col=1)
 
+    # Lines only need ~MAX_LINE_POINTS points to look the same; stride from the end so the latest bar is kept
+    stride = max(1, len(df) // MAX_LINE_POINTS)
+    df_line = df.iloc[::-stride].iloc[::-1] if stride > 1 else df
+
     # MAs
     colors = {'SMA7': 'yellow', 'SMA25': 'orange', 'SMA100': 'cyan', 'SMA200': 'purple', 'EMA20': 'white'}
     for ma, color in colors.items():
-        if ma in df.columns:
-            fig.add_trace(go.Scatter(x=df['timestamp'], y=df[ma], name=ma, line=dict(color=color, width=1)), row=1, col=1)
+        if ma in df_line.columns:
+            fig.add_trace(go.Scatter(x=df_line['timestamp'], y=df_line[ma], name=ma, line=dict(color=color, width=1)), row=1, col=1)
 
     # MACD
-    if 'MACD' in df.columns:
-        fig.add_trace(go.Scatter(x=df['timestamp'], y=df['MACD'], name='MACD', line=dict(color='blue', width=1)), row=2, col=1)
-        fig.add_trace(go.Scatter(x=df['timestamp'], y=df['MACD_Signal'], name='Signal', line=dict(color='orange', width=1)), row=2, col=1)
-        fig.add_trace(go.Bar(x=df['timestamp'], y=df['MACD_Hist'], name='Histogram'), row=2, col=1)
+    if 'MACD' in df_line.columns:
+        fig.add_trace(go.Scatter(x=df_line['timestamp'], y=df_line['MACD'], name='MACD', line=dict(color='blue', width=1)), row=2, col=1)
+        fig.add_trace(go.Scatter(x=df_line['timestamp'], y=df_line['MACD_Signal'], name='Signal', line=dict(color='orange', width=1)), row=2, col=1)
+        fig.add_trace(go.Bar(x=df_line['timestamp'], y=df_line['MACD_Hist'], name='Histogram'), row=2, col=1)
 
     fig.update_layout(height=800, xaxis_rangeslider_visible=False, template="plotly_dark")
     return fig
@@ -117,42 +155,38 @@ tfs = logic.TIMEFRAMES
 rows = []
 all_signals = []
 
-# Progress bar
-progress_text = "データを取得中..."
-my_bar = st.progress(0, text=progress_text)
-percent_complete = 0
-step = 100 // len(tfs)
-
 # Store DataFrames for charting later
 dfs = {}
+errors = {}
 
-for i, (tf_key, tf_val) in enumerate(tfs.items()):
-    df, error_msg = load_data(exchange_id, symbol, tf_val, logic.LIMIT)
-    
+with st.spinner("データを取得中..."):
+    results = load_data(exchange_id, symbol, tfs, logic.LIMIT)
+
+for tf_key, (df, error_msg) in results.items():
     if df is not None:
-        df = logic.calculate_indicators(df)
         dfs[tf_key] = df
+    else:
+        errors[tf_key] = error_msg
+
+trends = logic.analyze_trends(dfs)
+
+for tf_key, _ in tfs:
+    if tf_key in dfs:
+        df = dfs[tf_key]
         
-        trend = logic.analyze_trend(df, tf_key)
+        trend = trends[tf_key]
         signals = logic.detect_signals(df, tf_key)
         all_signals.extend(signals)
         
         if not df.empty:
-             last_row = df.iloc[-1]
-             price = last_row['close']
-             sma200 = last_row.get('SMA200', 0)
-             macd = last_row.get('MACD', 0)
-             rows.append([tf_key, f"{price:,.2f}", trend, f"{sma200:,.2f}" if not pd.isna(sma200) else "N/A", f"{macd:.2f}" if not pd.isna(macd) else "N/A"])
+             tail = logic.tail_values(df)
+             price, sma200, macd = tail['close'], tail['SMA200'], tail['MACD']
+             rows.append([tf_key, f"{price:,.2f}", trend, f"{sma200:,.2f}" if not math.isnan(sma200) else "N/A", f"{macd:.2f}" if not math.isnan(macd) else "N/A"])
         else:
             rows.append([tf_key, "N/A", "Empty Data", "N/A", "N/A"])
     else:
         # Display the specific error message from the capture
-        rows.append([tf_key, "N/A", f"Error: {error_msg}", "N/A", "N/A"])
-
-    percent_complete += step
-    my_bar.progress(min(percent_complete, 100), text=f"{tf_key} 完了")
-
-my_bar.empty()
+        rows.append([tf_key, "N/A", f"Error: {errors[tf_key]}", "N/A", "N/A"])
 
 # Display Table
 summary_df = pd.DataFrame(rows, columns=["時間足", "価格", "トレンド", "SMA200", "MACD"])
@@ -181,7 +215,7 @@ st.markdown("---")
 
 # 4. Detailed Charts
 st.subheader("詳細チャート分析")
-selected_tf = st.selectbox("チャートを表示する時間足を選択", list(tfs.keys()), index=2) # Default to Daily or 1d (index 2)
+selected_tf = st.selectbox("チャートを表示する時間足を選択", logic.TIMEFRAME_KEYS, index=2) # Default to Daily or 1d (index 2)
 
 if selected_tf in dfs:
     st.plotly_chart(plot_chart(dfs[selected_tf], selected_tf), use_container_width=True)
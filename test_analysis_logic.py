@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import analysis_logic as logic
+
+N_BARS = 1000
+HISTORY = 2100
+
+rng = np.random.default_rng(42)
+CLOSES = 50000 * np.exp(np.cumsum(rng.normal(0, 0.01, HISTORY)))
+TIMESTAMPS = pd.date_range('2020-01-01', periods=HISTORY, freq='h')
+
+
+def make_frame(end, live_close=None):
+    """LIMIT-sized window ending at bar `end`; `live_close` overrides the still-forming last candle."""
+    close = CLOSES[end - N_BARS:end].astype(np.float32)
+    if live_close is not None:
+        close[-1] = live_close
+    return pd.DataFrame({'timestamp': TIMESTAMPS[end - N_BARS:end], 'close': close})
+
+
+@pytest.fixture(params=['talib', 'numba'])
+def backend(request, monkeypatch):
+    if request.param == 'talib':
+        if logic.talib is None:
+            pytest.skip("TA-Lib not installed")
+    else:
+        monkeypatch.setattr(logic, 'talib', None)
+    return request.param
+
+
+def assert_matches_full_recompute(got, frame):
+    expected = logic.calculate_indicators(frame.copy())
+    for col in logic.INDICATOR_COLUMNS:
+        a = got[col].to_numpy(dtype=np.float64)
+        b = expected[col].to_numpy(dtype=np.float64)
+        np.testing.assert_array_equal(np.isnan(a), np.isnan(b), err_msg=col)
+        if col in logic.MACD_COLUMNS or col == 'EMA20':
+            # EMAs keep earlier history; compare once that has decayed away
+            np.testing.assert_allclose(a[-500:], b[-500:], rtol=1e-5, atol=1e-3, err_msg=col)
+        else:
+            np.testing.assert_allclose(a, b, rtol=1e-9, equal_nan=True, err_msg=col)
+
+
+@pytest.mark.parametrize('steps', [
+    [(1000, None), (1000, 51000.0)],              # live candle changes
+    [(1000, None), (1001, None)],                 # one new bar
+    [(1000, None), (1003, None)],                 # window shifted by 3 bars
+    [(1000, None), (1001, None), (1005, 49000.0), (1040, None)],
+    [(1000, None), (1250, None)],                 # large jump, still overlapping
+])
+def test_update_indicators_matches_full_recompute(backend, steps):
+    state = {}
+    for end, live_close in steps:
+        frame = make_frame(end, live_close)
+        got = logic.update_indicators(frame.copy(), state)
+        assert_matches_full_recompute(got, frame)
+
+
+def test_update_indicators_reuses_indicators_for_unchanged_close(backend):
+    state = {}
+    first = logic.update_indicators(make_frame(1000), state)
+
+    frame = make_frame(1000)
+    frame['high'] = frame['close'] * 1.01  # live candle moved, close did not
+    got = logic.update_indicators(frame, state)
+
+    assert got is frame
+    assert 'high' in got.columns
+    for col in logic.INDICATOR_COLUMNS:
+        assert got[col].dtype == first[col].dtype
+        np.testing.assert_array_equal(got[col].to_numpy(), first[col].to_numpy(), err_msg=col)
+
+
+def test_update_indicators_recomputes_without_overlap(backend):
+    state = {}
+    logic.update_indicators(make_frame(1000), state)
+    frame = make_frame(2100)  # starts after the previous anchor bar
+    got = logic.update_indicators(frame.copy(), state)
+    assert_matches_full_recompute(got, frame)
+    assert state['last_ts'] == frame['timestamp'].iloc[-2]
+
+
+def test_calculate_indicators_batch_matches_calculate_indicators(backend):
+    frames = {'a': make_frame(1000), 'b': make_frame(1300), 'short': make_frame(1000).iloc[-150:].reset_index(drop=True)}
+    frames['c'] = make_frame(2100).iloc[-700:].reset_index(drop=True)  # different length: its own group
+    expected = {k: logic.calculate_indicators(df.copy()) for k, df in frames.items()}
+
+    logic.calculate_indicators_batch(frames)
+
+    assert 'SMA200' not in frames['short'].columns
+    for k in ('a', 'b', 'c'):
+        for col in logic.INDICATOR_COLUMNS:
+            np.testing.assert_allclose(
+                frames[k][col].to_numpy(dtype=np.float64), expected[k][col].to_numpy(dtype=np.float64),
+                rtol=1e-5, atol=1e-3, equal_nan=True, err_msg=f"{k} {col}",
+            )